@@ -1,7 +1,9 @@
 import datetime
+import json
 import logging
 import os
 import secrets
+import time
 
 import requests
 from flask import (
@@ -9,12 +11,25 @@ from flask import (
     request,
     jsonify,
     stream_with_context,
-    render_template_string,
+    render_template,
     g,
 )
 from flask_cors import CORS
 
+from budget import ContextBudget, ContextBudgetExceeded
+from health import health_checker, local_check, upstream_check
+from metrics import counters
 from security import security_manager, SecurityException
+from streaming import client_socket_from_environ, relay_stream
+from timeouts import (
+    DEADLINE_HEADER,
+    DeadlineInvalid,
+    UpstreamTimeouts,
+    is_read_timeout,
+    load_model_timeouts,
+    parse_deadline,
+    remaining_seconds,
+)
 
 app = Flask("OpenGen Testers API")
 CORS(app)
@@ -32,6 +47,23 @@ except KeyError as exc:
     raise RuntimeError(f"Missing required environment variable: {exc.args[0]}")
 
 PUBLIC_ENDPOINT_URL = os.environ.get("PUBLIC_ENDPOINT_URL", "").strip()
+STREAM_WRITE_TIMEOUT_SECONDS = float(os.environ.get("STREAM_WRITE_TIMEOUT_SECONDS", "30"))
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", "8192"))
+MAX_CLIENT_DEADLINE_SECONDS = float(os.environ.get("MAX_CLIENT_DEADLINE_SECONDS", "300"))
+
+health_checker.register(
+    "upstream",
+    upstream_check(
+        TARGET_BASE_URL,
+        INTERNAL_API_KEY,
+        os.environ.get("HEALTH_CHECK_PATH", "/models"),
+        float(os.environ.get("HEALTH_CHECK_TIMEOUT_SECONDS", "3")),
+    ),
+)
+health_checker.register(
+    "rate_limiter",
+    local_check(security_manager.rate_limiter.is_responsive, "rate limiter lock is stuck"),
+)
 
 UPSTREAM_MODEL_MAPPING = {
     "npt-1.5": "gemini-2.5-flash-thinking-search",
@@ -39,6 +71,32 @@ UPSTREAM_MODEL_MAPPING = {
     "npt-2.0-non-reasoning": "grok-4-fast-non-reasoning-poe",
 }
 
+DEFAULT_UPSTREAM_TIMEOUTS = UpstreamTimeouts(
+    connect=float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5")),
+    first_byte=float(os.environ.get("UPSTREAM_FIRST_BYTE_TIMEOUT_SECONDS", "45")),
+    idle=float(os.environ.get("UPSTREAM_IDLE_TIMEOUT_SECONDS", "30")),
+    completion=float(os.environ.get("UPSTREAM_COMPLETION_TIMEOUT_SECONDS", "120")),
+)
+
+# Only fields a model genuinely needs to differ on; everything else follows
+# the UPSTREAM_*_TIMEOUT_SECONDS defaults. UPSTREAM_MODEL_TIMEOUTS takes a JSON
+# object such as {"npt-base": {"first_byte": 20}} and overrides both.
+BUILTIN_MODEL_TIMEOUTS = {
+    "npt-1.5": {"first_byte": 90, "idle": 60, "completion": 180},
+}
+
+UPSTREAM_TIMEOUTS = load_model_timeouts(
+    DEFAULT_UPSTREAM_TIMEOUTS,
+    BUILTIN_MODEL_TIMEOUTS,
+    os.environ.get("UPSTREAM_MODEL_TIMEOUTS", ""),
+)
+
+MODEL_CONTEXT_LIMITS = {
+    "npt-1.5": 1048576,
+    "npt-base": 16385,
+    "npt-2.0-non-reasoning": 2000000,
+}
+
 AVAILABLE_MODELS = [
     {"id": "npt-1.5", "object": "model", "created": 1690000000, "owned_by": "opengen"},
     {"id": "npt-base", "object": "model", "created": 1690000000, "owned_by": "opengen"},
@@ -556,34 +614,64 @@ Simply respond as NPT: confident, intelligent, and focused on direct answers.
 Mission OpenGen Team: Make powerful AI technology accessible to everyone for free.
 """
 
+context_budget = ContextBudget(
+    MODEL_CONTEXT_LIMITS,
+    policy=os.environ.get("CONTEXT_OVERFLOW_POLICY", "reject").strip().lower(),
+    pinned_texts=[NPT_SYSTEM_PROMPT],
+)
+
 generated_keys = {}
 
+for static_key in os.environ.get("STATIC_API_KEYS", "").split(","):
+    if static_key.strip():
+        generated_keys[static_key.strip()] = {"valid": True, "created": "static"}
+
 def generate_api_key():
     return f"sk-opengen-{secrets.token_urlsafe(32)}"
 
 def validate_proxy_key(api_key: str) -> bool:
     return api_key in generated_keys
 
+def timeout_response(code: str, message: str):
+    counters.increment(f"timeouts.{code}")
+    return jsonify({"error": message, "code": code, "request_id": g.request_id}), 504
+
 @app.before_request
 def enforce_security():
     g.request_id = secrets.token_hex(6)
-    try:
-        security_manager.enforce(request)
-    except SecurityException as exc:
-        logger.warning(
-            "Security violation | request_id=%s path=%s reason=%s",
-            g.request_id,
-            request.path,
-            exc.message,
-        )
-        response = jsonify({"error": exc.message, "code": exc.code, "request_id": g.request_id})
-        response.status_code = exc.status_code
-        return response
+    g.request_started = time.monotonic()
+    health_checker.ensure_started()
+    security_manager.enforce(request)
+
+@app.errorhandler(SecurityException)
+def handle_security_exception(exc):
+    counters.increment(f"rejected.{exc.code}")
+    logger.warning(
+        "Security violation | request_id=%s path=%s reason=%s",
+        g.request_id,
+        request.path,
+        exc.message,
+    )
+    response = jsonify({"error": exc.message, "code": exc.code, "request_id": g.request_id})
+    response.status_code = exc.status_code
+    return response
+
+_dashboard_template = None
+
+def get_dashboard_template():
+    # Compiled once per process instead of on every dashboard hit.
+    global _dashboard_template
+    if _dashboard_template is None:
+        _dashboard_template = app.jinja_env.from_string(HTML_TEMPLATE)
+    return _dashboard_template
+
+def warm_up():
+    get_dashboard_template()
 
 @app.route("/")
 def dashboard():
-    return render_template_string(
-        HTML_TEMPLATE,
+    return render_template(
+        get_dashboard_template(),
         dashboard_title="OpenGen Testers API Dashboard",
         dashboard_heading="OpenGen Testers API",
         public_endpoint_url=PUBLIC_ENDPOINT_URL,
@@ -596,6 +684,22 @@ def health_check():
         "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
     }), 200
 
+@app.route("/ready", methods=["GET"])
+def readiness_check():
+    snapshot = health_checker.snapshot()
+    snapshot["status"] = "ready" if snapshot["ready"] else "unavailable"
+    snapshot["timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    return jsonify(snapshot), 200 if snapshot["ready"] else 503
+
+@app.route("/metrics", methods=["GET"])
+def metrics_snapshot():
+    auth_header = request.headers.get("Authorization", "")
+    proxy_key = auth_header.replace("Bearer ", "")
+    if not validate_proxy_key(proxy_key):
+        logger.warning("Unauthorized metrics access | request_id=%s", g.request_id)
+        return jsonify({"error": "Invalid API key", "request_id": g.request_id}), 401
+    return jsonify({"pid": os.getpid(), "counters": counters.snapshot()}), 200
+
 @app.route("/v1/generate-key", methods=["POST"])
 def generate_key():
     new_key = generate_api_key()
@@ -627,8 +731,19 @@ def chat_completions():
         logger.warning("Unauthorized chat access | request_id=%s", g.request_id)
         return jsonify({"error": "Invalid API key", "request_id": g.request_id}), 401
 
-    data = request.get_json(silent=True)
-    if not data:
+    try:
+        deadline = parse_deadline(
+            request.headers.get(DEADLINE_HEADER), g.request_started, MAX_CLIENT_DEADLINE_SECONDS
+        )
+    except DeadlineInvalid as exc:
+        return jsonify({"error": str(exc), "code": "deadline_invalid", "request_id": g.request_id}), 400
+
+    body = security_manager.request_limits.read_body(request)
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+    if not data or not isinstance(data, dict):
         return jsonify({"error": "Request body must be JSON", "request_id": g.request_id}), 400
 
     model_req = data.get("model", "unknown")
@@ -642,10 +757,41 @@ def chat_completions():
     data["model"] = upstream_model
 
     messages = data.get("messages", [])
+    security_manager.request_limits.check_messages(messages)
     has_system_prompt = any(msg.get("role") == "system" for msg in messages)
     if messages and not has_system_prompt:
         messages.insert(0, {"role": "system", "content": NPT_SYSTEM_PROMPT})
-    data["messages"] = messages
+
+    max_output_tokens = data.get("max_completion_tokens") or data.get("max_tokens")
+    try:
+        trimmed_messages = context_budget.apply(
+            model_req,
+            messages,
+            max_output_tokens if isinstance(max_output_tokens, int) else None,
+        )
+    except ContextBudgetExceeded as exc:
+        counters.increment("rejected.context_length_exceeded")
+        logger.warning(
+            "Context window exceeded | request_id=%s model=%s estimated_tokens=%s limit=%s",
+            g.request_id,
+            model_req,
+            exc.estimated_tokens,
+            exc.limit,
+        )
+        return jsonify({
+            "error": exc.message,
+            "code": "context_length_exceeded",
+            "request_id": g.request_id,
+        }), 400
+    if len(trimmed_messages) != len(messages):
+        counters.increment("context_trimmed")
+        logger.info(
+            "Context trimmed | request_id=%s model=%s dropped_messages=%s",
+            g.request_id,
+            model_req,
+            len(messages) - len(trimmed_messages),
+        )
+    data["messages"] = trimmed_messages
 
     headers = {
         "Authorization": f"Bearer {INTERNAL_API_KEY}",
@@ -661,26 +807,42 @@ def chat_completions():
         data.get("stream", False),
     )
 
+    remaining = remaining_seconds(deadline)
+    if remaining is not None and remaining <= 0:
+        return timeout_response("deadline_exceeded", "Request deadline exceeded before reaching upstream.")
+    timeouts = UPSTREAM_TIMEOUTS.get(model_req, DEFAULT_UPSTREAM_TIMEOUTS).bounded_by(remaining)
+    stream_requested = bool(data.get("stream", False))
+    requests_timeout = timeouts.as_requests_timeout(stream_requested, remaining)
+    # Measured from when the request is sent, so a slow connect eats into
+    # the first-token budget rather than extending it.
+    first_byte_deadline = time.monotonic() + requests_timeout[1]
+
     try:
         upstream_response = requests.post(
             target_url,
             json=data,
             headers=headers,
-            timeout=120,
-            stream=data.get("stream", False),
+            timeout=requests_timeout,
+            stream=stream_requested,
         )
         upstream_response.raise_for_status()
 
-        if data.get("stream", False):
-            def generate():
-                for chunk in upstream_response.iter_content(chunk_size=8192):
-                    if chunk:
-                        yield chunk
+        if stream_requested:
+            relay = relay_stream(
+                upstream_response,
+                client_socket=client_socket_from_environ(request.environ),
+                write_timeout=STREAM_WRITE_TIMEOUT_SECONDS,
+                chunk_size=STREAM_CHUNK_SIZE,
+                idle_timeout=timeouts.idle,
+                deadline=deadline,
+                first_byte_deadline=first_byte_deadline,
+            )
             proxy_response = app.response_class(
-                stream_with_context(generate()),
+                stream_with_context(relay),
                 content_type=upstream_response.headers.get("Content-Type", "application/json"),
                 status=upstream_response.status_code,
             )
+            proxy_response.call_on_close(upstream_response.close)
             proxy_response.headers["X-OpenGen-Request-ID"] = g.request_id
             proxy_response.headers["X-Request-Provider"] = provider_label
             return proxy_response
@@ -693,16 +855,31 @@ def chat_completions():
         return flask_response
 
     except requests.exceptions.RequestException as error:
+        if not is_read_timeout(error):
+            logger.error(
+                "Upstream error | request_id=%s provider_label=%s error=%s",
+                g.request_id,
+                provider_label,
+                error,
+            )
+            return jsonify({
+                "error": f"Upstream API error: {error}",
+                "request_id": g.request_id,
+            }), 502
         logger.error(
-            "Upstream error | request_id=%s provider_label=%s error=%s",
+            "Upstream timeout | request_id=%s provider_label=%s mapped_model=%s error=%s",
             g.request_id,
             provider_label,
+            upstream_model,
             error,
         )
-        return jsonify({
-            "error": f"Upstream API error: {error}",
-            "request_id": g.request_id,
-        }), 502
+        if deadline is not None and time.monotonic() >= deadline:
+            return timeout_response("deadline_exceeded", "Request deadline exceeded while waiting for upstream.")
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return timeout_response("upstream_connect_timeout", "Timed out connecting to upstream.")
+        if stream_requested:
+            return timeout_response("upstream_first_byte_timeout", "Upstream did not respond in time.")
+        return timeout_response("upstream_completion_timeout", "Upstream did not finish the completion in time.")
     except Exception as error:
         logger.exception(
             "Unexpected error | request_id=%s provider_label=%s", g.request_id, provider_label
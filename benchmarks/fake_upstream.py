@@ -0,0 +1,196 @@
+"""Local OpenAI-compatible upstream used by the load-testing suite.
+
+Run standalone with ``python -m benchmarks.fake_upstream --port 9100`` or let
+``benchmarks.loadtest`` start it in-process.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeUpstreamConfig:
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        tokens_per_second: float = 200.0,
+        completion_tokens: int = 64,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        first_token_ms: float = 0.0,
+    ):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.first_token_ms = first_token_ms
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeUpstream/1.0"
+
+    def log_message(self, format, *args):
+        return
+
+    @property
+    def config(self) -> FakeUpstreamConfig:
+        return self.server.config
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(raw_body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+
+        time.sleep(self.config.latency_ms / 1000.0)
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            self._send_json(self.config.error_status, {"error": {"message": "injected failure"}})
+            return
+
+        model = payload.get("model", "fake-model")
+        if payload.get("stream"):
+            self._stream_completion(model)
+        else:
+            self._complete(model)
+
+    def _token_delay(self) -> float:
+        if self.config.tokens_per_second <= 0:
+            return 0.0
+        return 1.0 / self.config.tokens_per_second
+
+    def _complete(self, model: str):
+        tokens = self.config.completion_tokens
+        time.sleep(tokens * self._token_delay())
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(["tok"] * tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _stream_completion(self, model: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = self._token_delay()
+        try:
+            # Like real SSE upstreams: headers go out at once, the first token
+            # follows once the model starts producing output.
+            self.wfile.flush()
+            time.sleep(self.config.first_token_ms / 1000.0)
+            for index in range(self.config.completion_tokens):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": "tok "}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                if delay and index + 1 < self.config.completion_tokens:
+                    time.sleep(delay)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str, port: int, config: FakeUpstreamConfig):
+        super().__init__((host, port), FakeUpstreamHandler)
+        self.config = config
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_upstream_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--upstream-latency-ms", type=float, default=50.0)
+    parser.add_argument("--upstream-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--upstream-completion-tokens", type=int, default=64)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-error-status", type=int, default=500)
+    parser.add_argument("--upstream-first-token-ms", type=float, default=0.0)
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeUpstreamConfig:
+    return FakeUpstreamConfig(
+        latency_ms=args.upstream_latency_ms,
+        tokens_per_second=args.upstream_tokens_per_second,
+        completion_tokens=args.upstream_completion_tokens,
+        error_rate=args.upstream_error_rate,
+        error_status=args.upstream_error_status,
+        first_token_ms=args.upstream_first_token_ms,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+    server = FakeUpstreamServer(args.host, args.port, config_from_arguments(args))
+    print(f"Fake upstream listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""Load-testing suite for the proxy.
+
+Starts a local fake upstream, runs ``app:app`` under gunicorn for each worker
+configuration and drives it with concurrent clients. Example::
+
+    python -m benchmarks.loadtest --duration 15 --concurrency 32 \\
+        --workers-matrix 1x1,2x8,4x8 --json-output bench.json
+
+Pass ``--baseline bench.json`` on a later run to fail (exit code 1) when RPS
+drops or p95 latency grows by more than ``--max-regression``.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.fake_upstream import FakeUpstreamServer, add_upstream_arguments, config_from_arguments
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_GUNICORN_CONFIG = os.path.join(REPO_ROOT, "gunicorn.conf.py")
+BENCH_API_KEY = "sk-opengen-benchmark"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+SCENARIOS = {
+    "chat": {"method": "POST", "path": "/v1/chat/completions", "stream": False},
+    "chat_stream": {"method": "POST", "path": "/v1/chat/completions", "stream": True},
+    "models": {"method": "GET", "path": "/v1/models", "stream": False},
+    "dashboard": {"method": "GET", "path": "/", "stream": False},
+}
+
+
+class WorkerConfig:
+    def __init__(self, workers: int, threads: int):
+        self.workers = workers
+        self.threads = threads
+
+    @property
+    def worker_class(self) -> str:
+        return "gthread" if self.threads > 1 else "sync"
+
+    @property
+    def label(self) -> str:
+        return f"{self.workers}x{self.threads}"
+
+    @classmethod
+    def parse(cls, value: str) -> "WorkerConfig":
+        workers, _, threads = value.strip().partition("x")
+        return cls(int(workers), int(threads or 1))
+
+
+def _percentile(sorted_values, percent: float):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(percent / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _read_proc_stat(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="ascii") as handle:
+            fields = handle.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return {"ppid": int(fields[1]), "cpu_ticks": int(fields[11]) + int(fields[12])}
+
+
+def _read_rss_kb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _worker_pids(master_pid: int):
+    if not os.path.isdir("/proc"):
+        return []
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        stat = _read_proc_stat(int(entry))
+        if stat and stat["ppid"] == master_pid:
+            pids.append(int(entry))
+    return pids
+
+
+class ResourceSampler:
+    def __init__(self, master_pid: int, interval: float = 0.5):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak_rss_kb = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._start_ticks = {}
+        self._started_at = 0.0
+
+    def _cpu_ticks(self):
+        ticks = {}
+        for pid in _worker_pids(self.master_pid):
+            stat = _read_proc_stat(pid)
+            if stat:
+                ticks[pid] = stat["cpu_ticks"]
+        return ticks
+
+    def _run(self):
+        while not self._stop.is_set():
+            for pid in _worker_pids(self.master_pid):
+                rss = _read_rss_kb(pid)
+                if rss is not None:
+                    self.peak_rss_kb[pid] = max(rss, self.peak_rss_kb.get(pid, 0))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._start_ticks = self._cpu_ticks()
+        self._started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.perf_counter() - self._started_at
+        end_ticks = self._cpu_ticks()
+        cpu_percent = {}
+        for pid, ticks in end_ticks.items():
+            used = (ticks - self._start_ticks.get(pid, ticks)) / CLOCK_TICKS
+            cpu_percent[pid] = 100.0 * used / elapsed if elapsed else 0.0
+        return {
+            "cpu_percent_per_worker": _mean(cpu_percent.values()),
+            "cpu_percent_total": sum(cpu_percent.values()),
+            "rss_mb_per_worker": _mean(self.peak_rss_kb.values(), scale=1 / 1024.0),
+            "rss_mb_max": max(self.peak_rss_kb.values(), default=0) / 1024.0 or None,
+        }
+
+
+def _mean(values, scale: float = 1.0):
+    values = list(values)
+    if not values:
+        return None
+    return scale * sum(values) / len(values)
+
+
+class GunicornProcess:
+    def __init__(self, config: WorkerConfig, port: int, upstream_url: str, gunicorn_config: str, extra_env=None):
+        self.config = config
+        self.gunicorn_config = gunicorn_config
+        self.port = port
+        self.upstream_url = upstream_url
+        self.extra_env = extra_env or {}
+        self.process = None
+        self._log = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, ready_timeout: float = 30.0):
+        env = dict(os.environ)
+        env.update({
+            "TARGET_BASE_URL": self.upstream_url,
+            "INTERNAL_API_KEY": "benchmark-upstream-key",
+            "STATIC_API_KEYS": BENCH_API_KEY,
+            "RATE_LIMIT_MAX_REQUESTS": "1000000000",
+            "ALLOWED_PROXY_IPS": "",
+            "INTERNAL_SIGNING_SECRET": "",
+        })
+        env.update(self.extra_env)
+        command = [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--config", self.gunicorn_config,
+            "--chdir", REPO_ROOT,
+            "--bind", f"127.0.0.1:{self.port}",
+            "--workers", str(self.config.workers),
+            "--threads", str(self.config.threads),
+            "--worker-class", self.config.worker_class,
+            "--timeout", "300",
+            "--log-level", "warning",
+        ]
+        self._log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=self._log)
+        deadline = time.monotonic() + ready_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited early:\n{self._read_log()}")
+            try:
+                requests.get(f"{self.base_url}/health", headers={"X-Forwarded-Proto": "https"}, timeout=1)
+                if len(_worker_pids(self.process.pid)) >= self.config.workers or not os.path.isdir("/proc"):
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"gunicorn did not become ready:\n{self._read_log()}")
+
+    def _read_log(self) -> str:
+        self._log.seek(0)
+        return self._log.read().decode("utf-8", errors="replace")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log:
+            self._log.close()
+
+
+def _request_once(session: requests.Session, base_url: str, scenario: dict, prompt: str):
+    headers = {"Authorization": f"Bearer {BENCH_API_KEY}", "X-Forwarded-Proto": "https"}
+    url = f"{base_url}{scenario['path']}"
+    started = time.perf_counter()
+    first_byte = None
+    if scenario["method"] == "GET":
+        response = session.get(url, headers=headers, timeout=300)
+        content_ok = bool(response.content)
+    else:
+        body = {
+            "model": "npt-base",
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": scenario["stream"],
+        }
+        response = session.post(url, json=body, headers=headers, timeout=300, stream=scenario["stream"])
+        if scenario["stream"]:
+            content_ok = False
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk and first_byte is None:
+                    first_byte = time.perf_counter() - started
+                    content_ok = True
+        else:
+            content_ok = bool(response.content)
+    latency = time.perf_counter() - started
+    response.close()
+    return response.status_code < 400 and content_ok, latency, first_byte
+
+
+def run_scenario(base_url: str, scenario_name: str, concurrency: int, duration: float, prompt: str, master_pid: int):
+    scenario = SCENARIOS[scenario_name]
+    latencies = []
+    ttfts = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        with requests.Session() as session:
+            while time.perf_counter() < stop_at:
+                try:
+                    ok, latency, ttft = _request_once(session, base_url, scenario, prompt)
+                except requests.exceptions.RequestException:
+                    ok, latency, ttft = False, None, None
+                with lock:
+                    if not ok:
+                        errors[0] += 1
+                    if latency is not None and ok:
+                        latencies.append(latency)
+                    if ttft is not None and ok:
+                        ttfts.append(ttft)
+
+    sampler = ResourceSampler(master_pid)
+    sampler.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    resources = sampler.stop()
+
+    latencies.sort()
+    ttfts.sort()
+    result = {
+        "scenario": scenario_name,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _ms(_percentile(latencies, 50)),
+        "p95_ms": _ms(_percentile(latencies, 95)),
+        "p99_ms": _ms(_percentile(latencies, 99)),
+        "ttft_p50_ms": _ms(_percentile(ttfts, 50)),
+        "ttft_p95_ms": _ms(_percentile(ttfts, 95)),
+    }
+    result.update(resources)
+    return result
+
+
+def _ms(value):
+    return None if value is None else value * 1000.0
+
+
+def _format_cell(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+
+REPORT_COLUMNS = [
+    ("config", "config"),
+    ("scenario", "scenario"),
+    ("requests", "reqs"),
+    ("errors", "errs"),
+    ("rps", "rps"),
+    ("p50_ms", "p50ms"),
+    ("p95_ms", "p95ms"),
+    ("p99_ms", "p99ms"),
+    ("ttft_p50_ms", "ttft50"),
+    ("ttft_p95_ms", "ttft95"),
+    ("cpu_percent_per_worker", "cpu%/wkr"),
+    ("rss_mb_per_worker", "rssMB/wkr"),
+]
+
+
+def print_report(results):
+    rows = [[header for _, header in REPORT_COLUMNS]]
+    for result in results:
+        rows.append([_format_cell(result.get(key)) for key, _ in REPORT_COLUMNS])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(REPORT_COLUMNS))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def find_regressions(results, baseline, max_regression: float):
+    previous = {(item["config"], item["scenario"]): item for item in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get((result["config"], result["scenario"]))
+        if not base:
+            continue
+        if base.get("rps") and result["rps"] < base["rps"] * (1 - max_regression):
+            regressions.append(f"{result['config']}/{result['scenario']}: rps {base['rps']:.1f} -> {result['rps']:.1f}")
+        if base.get("p95_ms") and result.get("p95_ms") and result["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{result['config']}/{result['scenario']}: p95 {base['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the proxy against a local fake upstream")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers-matrix", default="1x1,2x4", help="Comma-separated WORKERSxTHREADS entries")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument(
+        "--gunicorn-config",
+        default=DEFAULT_GUNICORN_CONFIG,
+        help="Gunicorn config file; passed explicitly so results do not depend on the working directory",
+    )
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--upstream-port", type=int, default=0)
+    parser.add_argument("--prompt-chars", type=int, default=512)
+    parser.add_argument("--json-output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    add_upstream_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    configs = [WorkerConfig.parse(item) for item in args.workers_matrix.split(",") if item.strip()]
+    prompt = ("benchmark " * (args.prompt_chars // 10 + 1))[: args.prompt_chars]
+
+    upstream = FakeUpstreamServer("127.0.0.1", args.upstream_port, config_from_arguments(args)).start()
+    results = []
+    try:
+        for config in configs:
+            server = GunicornProcess(config, args.port, upstream.base_url, os.path.abspath(args.gunicorn_config)).start()
+            try:
+                for scenario_name in scenarios:
+                    result = run_scenario(
+                        server.base_url, scenario_name, args.concurrency, args.duration, prompt, server.process.pid
+                    )
+                    result["config"] = config.label
+                    results.append(result)
+                    print(
+                        f"[{config.label}] {scenario_name}: {result['rps']:.1f} rps, "
+                        f"p95 {_format_cell(result['p95_ms'])}ms, errors {result['errors']}",
+                        file=sys.stderr,
+                    )
+            finally:
+                server.stop()
+    finally:
+        upstream.stop()
+
+    print_report(results)
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            regressions = find_regressions(results, json.load(handle), args.max_regression)
+        if regressions:
+            print("Regressions detected:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import math
+from typing import Dict, Iterable, List, Optional
+
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMER_TOKENS = 3
+
+POLICY_REJECT = "reject"
+POLICY_TRIM = "trim"
+
+
+class ContextBudgetExceeded(Exception):
+    def __init__(self, message: str, estimated_tokens: int, limit: int):
+        super().__init__(message)
+        self.message = message
+        self.estimated_tokens = estimated_tokens
+        self.limit = limit
+
+
+def estimate_text_tokens(text: str) -> int:
+    # Roughly four ASCII characters per token; non-ASCII text (CJK, emoji)
+    # tokenizes far denser, so multi-byte characters are charged extra.
+    if not text:
+        return 0
+    tokens = math.ceil(len(text) / 4)
+    if not text.isascii():
+        tokens += (len(text.encode("utf-8")) - len(text)) // 2
+    return tokens
+
+
+def _role(message) -> str:
+    return message.get("role", "") if isinstance(message, dict) else ""
+
+
+def _drop_units(messages: List[dict]) -> List[List[int]]:
+    # Messages that may only be dropped together, oldest first. An assistant
+    # turn that issued tool or function calls owns the replies that follow
+    # it; upstreams reject a reply whose call is gone, or a call without its
+    # replies. System messages are never dropped and start no unit.
+    units = []
+    for index, message in enumerate(messages):
+        role = _role(message)
+        if role == "system":
+            continue
+        if role in ("tool", "function") and units and units[-1][-1] == index - 1:
+            owner = messages[units[-1][0]]
+            if _role(owner) == "assistant" and (owner.get("tool_calls") or owner.get("function_call")):
+                units[-1].append(index)
+                continue
+        units.append([index])
+    return units
+
+
+class ContextBudget:
+    def __init__(self, context_limits: Dict[str, int], policy: str = POLICY_REJECT, pinned_texts: Iterable[str] = ()):
+        if policy not in (POLICY_REJECT, POLICY_TRIM):
+            raise ValueError(f"Unknown context overflow policy: {policy}")
+        self.context_limits = context_limits
+        self.policy = policy
+        self._pinned_counts = {text: estimate_text_tokens(text) for text in pinned_texts}
+
+    def text_tokens(self, text: str) -> int:
+        cached = self._pinned_counts.get(text)
+        if cached is not None:
+            return cached
+        return estimate_text_tokens(text)
+
+    def message_tokens(self, message) -> int:
+        if not isinstance(message, dict):
+            return MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens = self.text_tokens(content)
+        elif isinstance(content, list):
+            tokens = sum(
+                self.text_tokens(part["text"])
+                for part in content
+                if isinstance(part, dict) and isinstance(part.get("text"), str)
+            )
+        else:
+            tokens = 0
+        return tokens + MESSAGE_OVERHEAD_TOKENS
+
+    def apply(self, model: str, messages: List[dict], max_output_tokens: Optional[int] = None) -> List[dict]:
+        limit = self.context_limits.get(model)
+        if not limit or not isinstance(messages, list):
+            return messages
+        budget = limit - REPLY_PRIMER_TOKENS - (max_output_tokens or 0)
+        counts = [self.message_tokens(message) for message in messages]
+        total = sum(counts)
+        if total <= budget:
+            return messages
+        if self.policy == POLICY_TRIM:
+            keep = [True] * len(messages)
+            units = _drop_units(messages)
+            for unit in units[:-1]:
+                if total <= budget:
+                    break
+                keep[unit[0]:unit[-1] + 1] = [False] * len(unit)
+                total -= sum(counts[index] for index in unit)
+            if total <= budget:
+                return [message for message, kept in zip(messages, keep) if kept]
+        raise ContextBudgetExceeded(
+            f"Prompt is about {total} tokens, which exceeds the {limit}-token context window of model '{model}'"
+            + (f" with {max_output_tokens} tokens reserved for output." if max_output_tokens else "."),
+            estimated_tokens=total,
+            limit=limit,
+        )
@@ -0,0 +1,78 @@
+import gc
+import os
+import time
+
+_started_at = time.monotonic()
+
+SERVING_MODES = {
+    # mode: (workers per CPU, extra workers, threads per worker)
+    "standard": (2, 1, 4),
+    "streaming": (1, 1, 32),
+}
+
+
+def _available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+serving_mode = os.environ.get("SERVING_MODE", "streaming").strip().lower()
+if serving_mode not in SERVING_MODES:
+    raise RuntimeError(f"Unknown SERVING_MODE: {serving_mode}")
+_per_cpu, _extra, _default_threads = SERVING_MODES[serving_mode]
+
+# Keys minted through /v1/generate-key and the rate-limit buckets live in one
+# worker's memory, so running several workers breaks the dashboard flow and
+# multiplies the effective rate limit. Operators opt in explicitly with
+# WEB_CONCURRENCY or AUTO_SCALE_WORKERS=true; see DEPLOY.md.
+if os.environ.get("AUTO_SCALE_WORKERS", "false").lower() == "true":
+    _default_workers = min(_available_cpus() * _per_cpu + _extra, int(os.environ.get("MAX_WORKERS", "16")))
+else:
+    _default_workers = 1
+    _default_threads *= 2
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", str(_default_workers)))
+threads = int(os.environ.get("GUNICORN_THREADS", str(_default_threads)))
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+
+        app.warm_up()
+        # Move everything imported so far out of the collector's reach so
+        # forked workers do not dirty shared pages during GC passes.
+        gc.freeze()
+    server.log.info(
+        "Master ready in %.2fs | mode=%s workers=%s threads=%s worker_class=%s preload=%s",
+        time.monotonic() - _started_at,
+        serving_mode,
+        workers,
+        threads,
+        worker_class,
+        preload_app,
+    )
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    from health import health_checker
+
+    health_checker.ensure_started(prime=True)
+    worker.log.info(
+        "Worker %s ready in %.3fs after fork",
+        worker.pid,
+        time.monotonic() - getattr(worker, "forked_at", _started_at),
+    )
@@ -0,0 +1,162 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict
+
+import requests
+
+logger = logging.getLogger("opengen_proxy.health")
+
+UNHEALTHY_STATUS_CODES = {401, 403, 429}
+
+
+class HealthCheckResult:
+    def __init__(self, healthy: bool, detail: str = "", latency_ms: float = 0.0):
+        self.healthy = healthy
+        self.detail = detail
+        self.latency_ms = latency_ms
+        self.checked_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "detail": self.detail,
+            "latency_ms": round(self.latency_ms, 1),
+            "checked_at": datetime.datetime.fromtimestamp(self.checked_at, datetime.timezone.utc).isoformat(),
+        }
+
+
+class HealthChecker:
+    def __init__(
+        self,
+        interval_seconds: float = 10.0,
+        failure_threshold: int = 2,
+    ):
+        self.interval_seconds = interval_seconds
+        self.failure_threshold = max(1, failure_threshold)
+        self._checks: Dict[str, Callable[[], HealthCheckResult]] = {}
+        self._results: Dict[str, HealthCheckResult] = {}
+        self._failures: Dict[str, int] = {}
+        self._passed: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._owner_pid = None
+
+    def register(self, name: str, check: Callable[[], HealthCheckResult]):
+        self._checks[name] = check
+
+    def ensure_started(self, prime: bool = False):
+        # Threads do not survive fork, so each gunicorn worker starts its own.
+        # With prime=True the first round runs inline, so the worker's first
+        # probe is answered from real results instead of "pending".
+        if self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._owner_pid == os.getpid():
+                return
+            self._owner_pid = os.getpid()
+            self._results = {}
+            self._failures = {}
+            self._passed = {}
+            self._stop = threading.Event()
+        if prime:
+            self.run_checks()
+        self._thread = threading.Thread(target=self._run, args=(prime,), name="health-checker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, primed: bool = False):
+        if primed:
+            self._stop.wait(self.interval_seconds)
+        while not self._stop.is_set():
+            self.run_checks()
+            self._stop.wait(self.interval_seconds)
+
+    def run_checks(self):
+        for name, check in list(self._checks.items()):
+            started = time.perf_counter()
+            try:
+                result = check()
+            except Exception as exc:
+                result = HealthCheckResult(False, f"{type(exc).__name__}: {exc}")
+            if not result.latency_ms:
+                result.latency_ms = (time.perf_counter() - started) * 1000.0
+            with self._lock:
+                previous = self._results.get(name)
+                self._results[name] = result
+                self._failures[name] = 0 if result.healthy else self._failures.get(name, 0) + 1
+                self._passed[name] = self._passed.get(name, False) or result.healthy
+            if previous is not None and previous.healthy != result.healthy:
+                logger.warning("Health check changed | check=%s healthy=%s detail=%s", name, result.healthy, result.detail)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        stale_after = self.interval_seconds * 3
+        with self._lock:
+            results = dict(self._results)
+            failures = dict(self._failures)
+            passed = dict(self._passed)
+        checks = {}
+        ready = bool(self._checks)
+        for name in self._checks:
+            result = results.get(name)
+            if result is None:
+                checks[name] = {"healthy": False, "detail": "pending"}
+                ready = False
+                continue
+            entry = result.to_dict()
+            entry["consecutive_failures"] = failures.get(name, 0)
+            if now - result.checked_at > stale_after:
+                entry["detail"] = "stale"
+                ready = False
+            elif not passed.get(name, False):
+                # The failure threshold only smooths over blips after a check
+                # has passed; a worker that never saw a healthy result is not
+                # ready.
+                ready = False
+            elif failures.get(name, 0) >= self.failure_threshold:
+                ready = False
+            checks[name] = entry
+        return {"ready": ready, "checks": checks}
+
+
+def upstream_check(base_url: str, api_key: str, path: str, timeout: float) -> Callable[[], HealthCheckResult]:
+    session = requests.Session()
+    url = f"{base_url}{path}"
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    def check() -> HealthCheckResult:
+        started = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+            response.close()
+        except requests.exceptions.RequestException as exc:
+            return HealthCheckResult(False, f"unreachable: {type(exc).__name__}")
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        # 401/403 mean INTERNAL_API_KEY is wrong or revoked and 429 means the
+        # upstream quota is spent; chat calls would fail either way.
+        if response.status_code >= 500 or response.status_code in UNHEALTHY_STATUS_CODES:
+            return HealthCheckResult(False, f"status {response.status_code}", latency_ms)
+        return HealthCheckResult(True, f"status {response.status_code}", latency_ms)
+
+    return check
+
+
+def local_check(probe: Callable[[], bool], failure_detail: str) -> Callable[[], HealthCheckResult]:
+    def check() -> HealthCheckResult:
+        if not probe():
+            return HealthCheckResult(False, failure_detail)
+        return HealthCheckResult(True, "ok")
+
+    return check
+
+
+health_checker = HealthChecker(
+    interval_seconds=float(os.environ.get("HEALTH_CHECK_INTERVAL_SECONDS", "10")),
+    failure_threshold=int(os.environ.get("HEALTH_FAILURE_THRESHOLD", "2")),
+)
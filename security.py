@@ -1,10 +1,14 @@
 import hashlib
 import hmac
+import ipaddress
+import logging
 import os
 import threading
 import time
 from collections import deque
-from typing import Set
+from typing import Iterable, Optional, Union
+
+logger = logging.getLogger("opengen_proxy.security")
 
 
 class SecurityException(Exception):
@@ -36,26 +40,187 @@ class RateLimiter:
                 )
             bucket.append(now)
 
+    def is_responsive(self, timeout: float = 1.0) -> bool:
+        if not self._lock.acquire(timeout=timeout):
+            return False
+        self._lock.release()
+        return True
+
+
+class RequestLimits:
+    _READ_CHUNK_SIZE = 64 * 1024
+    _ENVIRON_KEY = "opengen.request_body"
+
+    def __init__(self, max_body_bytes: int = 0, max_messages: int = 0, max_message_chars: int = 0):
+        self.max_body_bytes = max_body_bytes
+        self.max_messages = max_messages
+        self.max_message_chars = max_message_chars
+
+    def check_content_length(self, flask_request):
+        content_length = flask_request.content_length
+        if self.max_body_bytes and content_length is not None and content_length > self.max_body_bytes:
+            raise self._body_too_large()
+
+    def read_body(self, flask_request) -> bytes:
+        # Read incrementally so chunked uploads without Content-Length are
+        # cut off at the cap instead of being buffered whole.
+        cached = flask_request.environ.get(self._ENVIRON_KEY)
+        if cached is not None:
+            return cached
+        self.check_content_length(flask_request)
+        chunks = []
+        total = 0
+        stream = flask_request.stream
+        while True:
+            chunk = stream.read(self._READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if self.max_body_bytes and total > self.max_body_bytes:
+                raise self._body_too_large()
+            chunks.append(chunk)
+        body = b"".join(chunks)
+        flask_request.environ[self._ENVIRON_KEY] = body
+        return body
+
+    def check_messages(self, messages):
+        if not isinstance(messages, list):
+            return
+        if self.max_messages and len(messages) > self.max_messages:
+            raise SecurityException(
+                f"Too many messages; the limit is {self.max_messages}.",
+                status_code=413,
+                code="too_many_messages",
+            )
+        if not self.max_message_chars:
+            return
+        for message in messages:
+            if isinstance(message, dict) and _content_length(message.get("content")) > self.max_message_chars:
+                raise SecurityException(
+                    f"Message content exceeds {self.max_message_chars} characters.",
+                    status_code=413,
+                    code="message_too_long",
+                )
+
+    def _body_too_large(self) -> SecurityException:
+        return SecurityException(
+            f"Request body exceeds {self.max_body_bytes} bytes.",
+            status_code=413,
+            code="payload_too_large",
+        )
+
+
+def _content_length(content) -> int:
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(
+            len(part["text"]) for part in content if isinstance(part, dict) and isinstance(part.get("text"), str)
+        )
+    return 0
+
+
+class IPPrefixTrie:
+    # Binary trie per IP version, so lookups cost at most 32 or 128 steps no
+    # matter how many ranges are configured.
+    _TERMINAL = 2
+
+    def __init__(self, networks: Iterable[str] = ()):
+        self._roots = {4: [None, None, False], 6: [None, None, False]}
+        self._size = 0
+        for network in networks:
+            self.add(network)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, network: str):
+        parsed = ipaddress.ip_network(network.strip(), strict=False)
+        node = self._roots[parsed.version]
+        if node[self._TERMINAL]:
+            return
+        address = int(parsed.network_address)
+        for shift in range(parsed.max_prefixlen - 1, parsed.max_prefixlen - 1 - parsed.prefixlen, -1):
+            bit = (address >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+            if node[self._TERMINAL]:
+                return
+        node[self._TERMINAL] = True
+        node[0] = node[1] = None
+        self._size += 1
+
+    def contains(self, address: str) -> bool:
+        parsed = _parse_ip(address)
+        if parsed is None:
+            return False
+        node = self._roots[parsed.version]
+        value = int(parsed)
+        for shift in range(parsed.max_prefixlen - 1, -1, -1):
+            if node[self._TERMINAL]:
+                return True
+            node = node[(value >> shift) & 1]
+            if node is None:
+                return False
+        return node[self._TERMINAL]
+
+
+def _parse_ip(value: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    candidate = value.strip()
+    if candidate.startswith("["):
+        candidate = candidate[1:].split("]", 1)[0]
+    elif candidate.count(":") == 1:
+        candidate = candidate.split(":", 1)[0]
+    try:
+        parsed = ipaddress.ip_address(candidate)
+    except ValueError:
+        return None
+    if parsed.version == 6 and parsed.ipv4_mapped is not None:
+        return parsed.ipv4_mapped
+    return parsed
+
 
 class SecurityManager:
     def __init__(self):
         allowed_ips = os.environ.get("ALLOWED_PROXY_IPS", "")
-        self.allowed_ips: Set[str] = {ip.strip() for ip in allowed_ips.split(",") if ip.strip()}
+        self.allowed_ips = IPPrefixTrie(ip for ip in allowed_ips.split(",") if ip.strip())
+        trusted_proxies = os.environ.get("TRUSTED_PROXY_CIDRS", "")
+        self.trusted_proxies = IPPrefixTrie(ip for ip in trusted_proxies.split(",") if ip.strip())
+        self.trusted_proxy_hops = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+        self._warned_untrusted_forwarding = False
         self.signing_secret = os.environ.get("INTERNAL_SIGNING_SECRET", "")
         self.timestamp_tolerance = int(os.environ.get("SIGNATURE_TOLERANCE_SECONDS", "300"))
         max_requests = int(os.environ.get("RATE_LIMIT_MAX_REQUESTS", "240"))
         window_seconds = int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "60"))
         self.rate_limiter = RateLimiter(max_requests=max_requests, window_seconds=window_seconds)
         self.require_https = os.environ.get("REQUIRE_HTTPS", "true").lower() == "true"
+        # The body default leaves room for a prompt filling the largest model
+        # window (2M tokens at roughly 4 bytes each, plus JSON framing). Prompt
+        # length per model is policed by the context budget in app.py, so the
+        # per-message character cap ships disabled.
+        self.request_limits = RequestLimits(
+            max_body_bytes=int(os.environ.get("MAX_REQUEST_BODY_BYTES", str(16 * 1024 * 1024))),
+            max_messages=int(os.environ.get("MAX_MESSAGES", "500")),
+            max_message_chars=int(os.environ.get("MAX_MESSAGE_CHARS", "0")),
+        )
 
-        default_optional = {"/", "/health", "/v1/generate-key", "/v1/models", "/v1/chat/completions"}
+        probe_env = os.environ.get("PROBE_PATHS", "/health,/ready")
+        self.probe_paths = {p.strip() for p in probe_env.split(",") if p.strip()}
+
+        default_optional = {"/", "/health", "/ready", "/v1/generate-key", "/v1/models", "/v1/chat/completions"}
         optional_env = os.environ.get("SIGNATURE_OPTIONAL_PATHS", "")
         env_optional = {p.strip() for p in optional_env.split(",") if p.strip()}
         self.signature_optional_paths = default_optional.union(env_optional)
 
     def enforce(self, flask_request):
+        # Load balancer probes arrive over plain HTTP from addresses outside
+        # the allowlist and must never be throttled by client traffic.
+        if flask_request.path in self.probe_paths:
+            return
         self._enforce_https(flask_request)
         self._enforce_ip_allowlist(flask_request)
+        self.request_limits.check_content_length(flask_request)
         if self.signing_secret and flask_request.path not in self.signature_optional_paths:
             self._verify_signature(flask_request)
         client_identifier = self._derive_client_identifier(flask_request)
@@ -69,13 +234,27 @@ class SecurityManager:
     def _enforce_ip_allowlist(self, flask_request):
         if not self.allowed_ips:
             return
-        forwarded_for = flask_request.headers.get("X-Forwarded-For", "")
-        remote_addr = flask_request.remote_addr or ""
-        candidates = {ip.strip() for ip in forwarded_for.split(",") if ip.strip()}
-        candidates.add(remote_addr)
-        if not candidates.intersection(self.allowed_ips):
+        if not self.allowed_ips.contains(self.resolve_client_ip(flask_request)):
             raise SecurityException("IP address is not allowed.", code="ip_not_allowed")
 
+    def resolve_client_ip(self, flask_request) -> str:
+        # Walk the chain right to left, skipping the configured number of
+        # proxy hops and any hop inside TRUSTED_PROXY_CIDRS.
+        remote_addr = flask_request.remote_addr or ""
+        forwarded_for = flask_request.headers.get("X-Forwarded-For", "")
+        if not forwarded_for or not self.trusts_forwarding:
+            return remote_addr
+        chain = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        chain.append(remote_addr)
+        for index in range(len(chain) - 1, -1, -1):
+            hop = chain[index]
+            if len(chain) - 1 - index < self.trusted_proxy_hops:
+                continue
+            if self.trusted_proxies and self.trusted_proxies.contains(hop):
+                continue
+            return hop
+        return chain[0]
+
     def _verify_signature(self, flask_request):
         signature = flask_request.headers.get("X-Internal-Signature")
         timestamp_header = flask_request.headers.get("X-Internal-Timestamp")
@@ -88,7 +267,7 @@ class SecurityManager:
         now = int(time.time())
         if abs(now - timestamp) > self.timestamp_tolerance:
             raise SecurityException("Timestamp is outside the allowed tolerance.", status_code=401, code="timestamp_out_of_range")
-        body = flask_request.get_data(cache=True) or b""
+        body = self.request_limits.read_body(flask_request)
         payload = f"{timestamp}.{body.decode('utf-8')}".encode("utf-8")
         expected_signature = hmac.new(
             self.signing_secret.encode("utf-8"),
@@ -102,10 +281,30 @@ class SecurityManager:
         authorization = flask_request.headers.get("Authorization", "").strip()
         if authorization:
             return authorization[-32:]
+        if self.trusts_forwarding:
+            return self.resolve_client_ip(flask_request) or "anonymous"
+        # Without a proxy trust setting, remote_addr behind a router is the
+        # router itself; keying on it would put every anonymous client in
+        # one bucket, so keep the leftmost X-Forwarded-For entry instead.
         forwarded_for = flask_request.headers.get("X-Forwarded-For", "")
         if forwarded_for:
+            self._warn_untrusted_forwarding()
             return forwarded_for.split(",")[0].strip()
         return flask_request.remote_addr or "anonymous"
 
+    @property
+    def trusts_forwarding(self) -> bool:
+        return bool(self.trusted_proxy_hops or self.trusted_proxies)
+
+    def _warn_untrusted_forwarding(self):
+        if self._warned_untrusted_forwarding:
+            return
+        self._warned_untrusted_forwarding = True
+        logger.warning(
+            "X-Forwarded-For received but neither TRUSTED_PROXY_HOPS nor TRUSTED_PROXY_CIDRS is set; "
+            "the IP allowlist sees only the connecting proxy and rate limits key on a client-supplied header. "
+            "See DEPLOY.md."
+        )
+
 
 security_manager = SecurityManager()
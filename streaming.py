@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import select
+import socket
+import ssl
+import threading
+import time
+
+import requests
+
+from metrics import counters
+from timeouts import is_read_timeout, set_read_timeout, upstream_socket
+
+logger = logging.getLogger("opengen_proxy.streaming")
+
+
+def client_socket_from_environ(environ):
+    # Only gunicorn exposes the raw client socket; other servers fall back to
+    # detecting disconnects when a write fails.
+    # TLS sockets are skipped too: MSG_PEEK is not supported on them and
+    # buffered TLS records would make readiness polling unreliable.
+    client_socket = environ.get("gunicorn.socket")
+    if not isinstance(client_socket, socket.socket) or isinstance(client_socket, ssl.SSLSocket):
+        return None
+    return client_socket
+
+
+_POLL_EVENTS = select.POLLIN | getattr(select, "POLLRDHUP", 0) if hasattr(select, "poll") else 0
+_HANGUP_EVENTS = (
+    select.POLLHUP | select.POLLERR | select.POLLNVAL | getattr(select, "POLLRDHUP", 0)
+    if hasattr(select, "poll") else 0
+)
+
+
+def _peer_closed(client_socket: socket.socket) -> bool:
+    try:
+        return client_socket.recv(1, socket.MSG_PEEK) == b""
+    except (BlockingIOError, ValueError):
+        return False
+    except OSError:
+        return True
+
+
+def _client_disconnected(client_socket: socket.socket) -> bool:
+    if not hasattr(select, "poll"):
+        return False
+    try:
+        poller = select.poll()
+        poller.register(client_socket, _POLL_EVENTS)
+        events = poller.poll(0)
+    except (OSError, ValueError):
+        return True
+    if not events:
+        return False
+    return bool(events[0][1] & _HANGUP_EVENTS) or _peer_closed(client_socket)
+
+
+class DisconnectWatcher:
+    # One thread per worker polls the client sockets of active streams. A
+    # relay blocked on a silent upstream cannot check its own client, so the
+    # watcher shuts the upstream socket down, which ends the blocked read.
+
+    def __init__(self, interval_seconds: float = 0.25):
+        self.interval_seconds = interval_seconds
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._owner_pid = None
+
+    def watch(self, client_socket: socket.socket, on_disconnect):
+        if not hasattr(select, "poll"):
+            return None
+        self._ensure_started()
+        token = object()
+        with self._lock:
+            self._watched[token] = (client_socket, on_disconnect)
+        self._wakeup.set()
+        return token
+
+    def unwatch(self, token):
+        if token is None:
+            return
+        with self._lock:
+            self._watched.pop(token, None)
+
+    def _ensure_started(self):
+        if self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._owner_pid == os.getpid():
+                return
+            self._owner_pid = os.getpid()
+            self._watched = {}
+            threading.Thread(target=self._run, name="disconnect-watcher", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self._poll_once()
+            except Exception:
+                # One misbehaving socket must not end disconnect detection
+                # for the rest of this worker's life.
+                logger.exception("Disconnect watcher iteration failed")
+                time.sleep(self.interval_seconds)
+
+    def _poll_once(self):
+        with self._lock:
+            watched = dict(self._watched)
+        if not watched:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            return
+        poller = select.poll()
+        by_fd = {}
+        for token, (client_socket, on_disconnect) in watched.items():
+            try:
+                fd = client_socket.fileno()
+                poller.register(fd, _POLL_EVENTS)
+            except (OSError, ValueError):
+                continue
+            by_fd[fd] = (token, client_socket, on_disconnect)
+        for fd, events in poller.poll(self.interval_seconds * 1000):
+            token, client_socket, on_disconnect = by_fd[fd]
+            if events & _HANGUP_EVENTS or _peer_closed(client_socket):
+                self.unwatch(token)
+                on_disconnect()
+            elif events & select.POLLIN:
+                # Pipelined request bytes keep the socket readable; stop
+                # polling it and rely on write errors instead.
+                self.unwatch(token)
+
+
+disconnect_watcher = DisconnectWatcher(float(os.environ.get("STREAM_DISCONNECT_POLL_SECONDS", "0.25")))
+
+
+def _abort_upstream(upstream_response, cancelled: threading.Event):
+    cancelled.set()
+    sock = upstream_socket(upstream_response)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _error_event(message: str, code: str) -> bytes:
+    error_type = "upstream_error" if code == "upstream_error" else "timeout_error"
+    payload = {"error": {"message": message, "type": error_type, "code": code}}
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def relay_stream(
+    upstream_response,
+    client_socket=None,
+    write_timeout: float = 0.0,
+    chunk_size: int = 8192,
+    idle_timeout: float = 0.0,
+    deadline=None,
+    first_byte_deadline=None,
+):
+    # Chunks are pulled from upstream only when the client has taken the
+    # previous one, so at most one chunk per stream sits in memory. A send
+    # timeout on the client socket turns a stalled reader into a write error.
+    original_timeout = None
+    if client_socket is not None and write_timeout:
+        original_timeout = client_socket.gettimeout()
+        client_socket.settimeout(write_timeout)
+    last_yield = None
+    outcome = None
+    cancelled = threading.Event()
+    watch_token = None
+    if client_socket is not None:
+        watch_token = disconnect_watcher.watch(client_socket, lambda: _abort_upstream(upstream_response, cancelled))
+    try:
+        chunks = upstream_response.iter_content(chunk_size=chunk_size)
+        while True:
+            # SSE upstreams send headers at once, so the wait for the first
+            # token is governed by the first-byte budget, then by idle.
+            read_budget = idle_timeout
+            if last_yield is None and first_byte_deadline is not None:
+                read_budget = max(first_byte_deadline - time.monotonic(), 0.001)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = "streams_cancelled.deadline_exceeded"
+                    yield _error_event("Request deadline exceeded.", "deadline_exceeded")
+                    return
+                read_budget = min(read_budget, remaining) if read_budget else remaining
+            if read_budget:
+                set_read_timeout(upstream_response, read_budget)
+            try:
+                chunk = next(chunks, None)
+            except requests.exceptions.RequestException as error:
+                if cancelled.is_set():
+                    outcome = "streams_cancelled.client_disconnect"
+                elif not is_read_timeout(error):
+                    outcome = "streams_cancelled.upstream_error"
+                    yield _error_event("Upstream stream was interrupted.", "upstream_error")
+                elif deadline is not None and time.monotonic() >= deadline:
+                    outcome = "streams_cancelled.deadline_exceeded"
+                    yield _error_event("Request deadline exceeded.", "deadline_exceeded")
+                elif last_yield is None and first_byte_deadline is not None:
+                    outcome = "streams_cancelled.upstream_first_byte_timeout"
+                    yield _error_event("Upstream did not start the response in time.", "upstream_first_byte_timeout")
+                else:
+                    outcome = "streams_cancelled.upstream_idle_timeout"
+                    yield _error_event("Upstream stopped sending data.", "upstream_idle_timeout")
+                return
+            if cancelled.is_set():
+                outcome = "streams_cancelled.client_disconnect"
+                return
+            if chunk is None:
+                break
+            if not chunk:
+                continue
+            if client_socket is not None and _client_disconnected(client_socket):
+                outcome = "streams_cancelled.client_disconnect"
+                return
+            last_yield = time.monotonic()
+            yield chunk
+        outcome = "streams_completed"
+    except GeneratorExit:
+        if outcome is None:
+            stalled = write_timeout and last_yield is not None and time.monotonic() - last_yield >= write_timeout
+            outcome = "streams_cancelled.slow_consumer" if stalled else "streams_cancelled.client_disconnect"
+        raise
+    finally:
+        disconnect_watcher.unwatch(watch_token)
+        upstream_response.close()
+        if client_socket is not None and write_timeout:
+            try:
+                client_socket.settimeout(original_timeout)
+            except OSError:
+                pass
+        if outcome is not None:
+            counters.increment(outcome)
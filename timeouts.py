@@ -0,0 +1,109 @@
+import json
+import time
+from typing import Dict, Optional
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class DeadlineInvalid(ValueError):
+    pass
+
+
+class UpstreamTimeouts:
+    FIELDS = ("connect", "first_byte", "idle", "completion")
+
+    # first_byte and idle apply to streamed requests. A non-streamed
+    # completion sends nothing until generation is done, so its read budget
+    # is the separate, longer completion timeout.
+    def __init__(self, connect: float, first_byte: float, idle: float, completion: float):
+        self.connect = connect
+        self.first_byte = first_byte
+        self.idle = idle
+        self.completion = completion
+
+    def merged(self, overrides: Dict[str, float]) -> "UpstreamTimeouts":
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        for field, value in overrides.items():
+            if field not in values:
+                raise ValueError(f"Unknown upstream timeout field: {field}")
+            values[field] = float(value)
+        return UpstreamTimeouts(**values)
+
+    def bounded_by(self, remaining: Optional[float]) -> "UpstreamTimeouts":
+        if remaining is None:
+            return self
+        return UpstreamTimeouts(
+            connect=min(self.connect, remaining),
+            first_byte=min(self.first_byte, remaining),
+            idle=min(self.idle, remaining),
+            completion=min(self.completion, remaining),
+        )
+
+    def as_requests_timeout(self, stream: bool, remaining: Optional[float] = None):
+        # Connect and the first read run back to back, so under a client
+        # deadline their sum, not each one, must fit in the time left.
+        read = self.first_byte if stream else self.completion
+        connect = self.connect
+        if remaining is not None and connect + read > remaining:
+            connect = min(connect, remaining / 2)
+            read = max(remaining - connect, 0.001)
+        return (connect, read)
+
+
+def load_model_timeouts(
+    defaults: UpstreamTimeouts,
+    builtin: Dict[str, Dict[str, float]],
+    overrides_json: str,
+) -> Dict[str, UpstreamTimeouts]:
+    overrides = json.loads(overrides_json) if overrides_json.strip() else {}
+    models = set(builtin) | set(overrides)
+    return {
+        model: defaults.merged(builtin.get(model, {})).merged(overrides.get(model, {}))
+        for model in models
+    }
+
+
+def is_read_timeout(error: requests.exceptions.RequestException) -> bool:
+    # A stall while reading the body surfaces as ConnectionError wrapping
+    # urllib3's ReadTimeoutError rather than as requests' ReadTimeout.
+    return isinstance(error, requests.exceptions.Timeout) or any(
+        isinstance(arg, ReadTimeoutError) for arg in error.args
+    )
+
+
+def parse_deadline(header_value: Optional[str], started_at: float, max_seconds: float) -> Optional[float]:
+    # The header carries the seconds the client is still willing to wait, so
+    # it is immune to clock skew; the result is a time.monotonic() deadline.
+    if not header_value:
+        return None
+    try:
+        seconds = float(header_value)
+    except ValueError as exc:
+        raise DeadlineInvalid(f"{DEADLINE_HEADER} must be a number of seconds.") from exc
+    if seconds != seconds or seconds <= 0:
+        raise DeadlineInvalid(f"{DEADLINE_HEADER} must be a positive number of seconds.")
+    if max_seconds:
+        seconds = min(seconds, max_seconds)
+    return started_at + seconds
+
+
+def remaining_seconds(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def upstream_socket(upstream_response):
+    connection = getattr(upstream_response.raw, "connection", None)
+    return getattr(connection, "sock", None)
+
+
+def set_read_timeout(upstream_response, seconds: float):
+    # requests applies one read timeout to every socket read; after the
+    # headers arrive, tighten it on the live socket to the idle budget.
+    sock = upstream_socket(upstream_response)
+    if sock is not None:
+        sock.settimeout(max(seconds, 0.001))